@@ -7,8 +7,6 @@ Shows complete workflow from setup to test generation
 import os
 import sys
 import subprocess
-import time
-from pathlib import Path
 
 def print_step(step_num, title):
     """Print a formatted step header"""
@@ -16,6 +14,48 @@ def print_step(step_num, title):
     print(f"STEP {step_num}: {title}")
     print(f"{'='*60}")
 
+# Directories left out of the project structure overview
+SKIP = {'__pycache__', 'build', 'cmake-build-debug', 'cmake-build-release', 'node_modules', '.git'}
+
+def _tree(root, depth=0, max_depth=3):
+    """Print a depth-limited directory tree"""
+    if depth > max_depth:
+        return
+    
+    with os.scandir(root) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    
+    indent = " " * 2 * depth
+    for entry in entries:
+        if entry.name.startswith('.') or entry.name in SKIP or entry.name.endswith('.pyc'):
+            continue
+        
+        if entry.is_dir():
+            print(f"{indent}{entry.name}/")
+            _tree(entry.path, depth + 1, max_depth)
+        else:
+            print(f"{indent}{entry.name}")
+
+def list_by_ext(root, exts):
+    """List files under root with one of the given extensions in a single scandir pass"""
+    found = []
+    stack = [root]
+    
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith('.') and entry.name not in SKIP:
+                            stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1] in exts:
+                        found.append(entry.path)
+        except FileNotFoundError:
+            continue
+    
+    return sorted(found)
+
 def run_command(cmd, description):
     """Run a command and show the result"""
     print(f"\n🔧 {description}")
@@ -59,30 +99,16 @@ def demo_workflow():
     print_step(2, "Project Structure Overview")
     
     print("\n📁 Current project structure:")
-    for root, dirs, files in os.walk("."):
-        # Skip hidden directories and build directories
-        dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ['__pycache__', 'build']]
-        
-        level = root.replace(".", "").count(os.sep)
-        indent = " " * 2 * level
-        print(f"{indent}{os.path.basename(root)}/")
-        
-        sub_indent = " " * 2 * (level + 1)
-        for file in files:
-            if not file.startswith('.') and not file.endswith('.pyc'):
-                print(f"{sub_indent}{file}")
+    print("./")
+    _tree(".", depth=1)
     
     # Step 3: Analyze Source Code
     print_step(3, "Analyzing Source Code")
     
     print("\n📋 Source files to be tested:")
-    src_files = []
-    for root, dirs, files in os.walk("src"):
-        for file in files:
-            if file.endswith(('.cpp', '.cc', '.cxx')):
-                file_path = os.path.join(root, file)
-                src_files.append(file_path)
-                print(f"  • {file_path}")
+    src_files = list_by_ext("src", {'.cpp', '.cc', '.cxx'})
+    for file_path in src_files:
+        print(f"  • {file_path}")
     
     if not src_files:
         print("❌ No C++ source files found in src/ directory")
@@ -105,10 +131,9 @@ def demo_workflow():
     
     if run_command(cmd, "Generating unit tests"):
         print("\n📁 Generated test files:")
-        if os.path.exists("tests"):
-            for file in os.listdir("tests"):
-                if file.endswith('.cpp'):
-                    print(f"  • tests/{file}")
+        test_files = list_by_ext("tests", {'.cpp'})
+        for file_path in test_files:
+            print(f"  • {file_path}")
     else:
         print("❌ Test generation failed")
         print("This might be due to:")
@@ -145,10 +170,7 @@ def demo_workflow():
     print("\n📊 Demo Results:")
     print(f"  • Source files analyzed: {len(src_files)}")
     
-    test_files = 0
-    if os.path.exists("tests"):
-        test_files = len([f for f in os.listdir("tests") if f.endswith('.cpp')])
-    print(f"  • Test files generated: {test_files}")
+    print(f"  • Test files generated: {len(test_files)}")
     
     if os.path.exists("tests/build"):
         print("  • Build attempted: Yes")
@@ -0,0 +1,3 @@
+"""
+C++ unit test generator: analysis, LLM generation, build and coverage tooling
+"""
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Bundle the YAML instruction files into a single JSON file
+The generator loads the bundle with one read instead of parsing every YAML file
+"""
+
+import argparse
+import json
+import os
+import sys
+import yaml
+from pathlib import Path
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+BUNDLE_NAME = "_bundle.json"
+
+def build_bundle(instruction_dir: str = "yaml_instructions") -> Path:
+    """Parse every instruction file and write them to the bundle, keyed by file stem"""
+    instruction_dir = Path(instruction_dir)
+    instructions = {}
+    
+    for yaml_file in sorted(instruction_dir.glob("*.yaml")):
+        with open(yaml_file, 'r') as f:
+            instructions[yaml_file.stem] = yaml.load(f, Loader=SafeLoader)
+    
+    # Write to a temporary file first so a reader never sees a partial bundle
+    bundle_path = instruction_dir / BUNDLE_NAME
+    tmp_path = bundle_path.with_name(bundle_path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(instructions, f)
+    os.replace(tmp_path, bundle_path)
+    
+    return bundle_path
+
+def main():
+    parser = argparse.ArgumentParser(description='Bundle YAML instruction files into JSON')
+    parser.add_argument('--dir', '-d', default='yaml_instructions',
+                       help='Directory containing the instruction YAML files')
+    
+    args = parser.parse_args()
+    
+    if not os.path.isdir(args.dir):
+        print(f"❌ Instruction directory does not exist: {args.dir}")
+        sys.exit(1)
+    
+    bundle_path = build_bundle(args.dir)
+    print(f"✅ Instructions bundled into {bundle_path}")
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,86 @@
 Build Manager for handling C++ compilation and build processes
 """
 
+import asyncio
+import functools
 import os
-import subprocess
-import tempfile
 import shutil
-from pathlib import Path
-from typing import Dict, List, Optional
+import subprocess
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# Presence checks are PATH lookups rather than running the tools. Availability
+# doesn't change during a run, so each probe runs once per process
+@functools.lru_cache(maxsize=1)
+def _check_cmake() -> bool:
+    """Check if CMake is available"""
+    return shutil.which('cmake') is not None
+
+@functools.lru_cache(maxsize=1)
+def _check_compiler() -> bool:
+    """Check if a C++ compiler is available"""
+    return any(shutil.which(compiler) for compiler in ('g++', 'clang++', 'cl'))
+
+@functools.lru_cache(maxsize=1)
+def _check_gtest() -> bool:
+    """Check if Google Test is available"""
+    # This is a simplified check - in reality, you'd want to check
+    # if GTest can be found by CMake
+    
+    # Try to find gtest headers or library
+    common_paths = [
+        '/usr/include/gtest',
+        '/usr/local/include/gtest',
+        'C:/Program Files/googletest/include/gtest'
+    ]
+    
+    for path in common_paths:
+        if os.path.exists(path):
+            return True
+    
+    # Try pkg-config, if it is installed
+    if shutil.which('pkg-config') is None:
+        return False
+    
+    try:
+        result = subprocess.run(
+            ['pkg-config', '--exists', 'gtest'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        return result.returncode == 0
+    except OSError:
+        return False
+
+# Bytes of build output kept for the log, and read from the pipe at a time
+_BUILD_TAIL_BYTES = 64 * 1024
+_BUILD_READ_SIZE = 16 * 1024
+
+def _decode_tail(tail: bytearray, truncated: bool) -> str:
+    """Decode the kept build output, dropping the line cut off at the start if it was truncated"""
+    if truncated:
+        newline = tail.find(b'\n')
+        if newline >= 0:
+            del tail[:newline + 1]
+    return tail.decode(errors='replace')
+
+def _fast_rmtree(root: str):
+    """Remove a directory tree with an iterative post-order scandir walk"""
+    stack = [(root, False)]
+    while stack:
+        path, visited = stack.pop()
+        if visited:
+            os.rmdir(path)
+            continue
+        
+        # Revisit the directory once its contents are gone
+        stack.append((path, True))
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, False))
+                else:
+                    os.unlink(entry.path)
 
 class BuildManager:
     """Manager for building C++ projects and tests"""
@@ -17,6 +91,40 @@ class BuildManager:
         self.cmake_generator = "Unix Makefiles"  # Can be changed for Windows
         
     def build(self, test_dir: str) -> Dict:
+        """Build the test project"""
+        return asyncio.run(self.build_async(test_dir))
+    
+    def build_all(self, test_dirs: List[str]) -> List[Dict]:
+        """Build several independent test projects concurrently"""
+        async def _build_all():
+            return await asyncio.gather(*(self.build_async(test_dir) for test_dir in test_dirs))
+        
+        return asyncio.run(_build_all())
+    
+    def run_tests(self, test_dir: str) -> Dict:
+        """Run the compiled tests"""
+        return asyncio.run(self.run_tests_async(test_dir))
+    
+    async def _run(self, cmd: List[str], timeout: float, cwd: Optional[str] = None) -> Tuple[int, str, str]:
+        """Run a command without blocking the event loop"""
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd
+        )
+        
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        finally:
+            # On timeout, cancellation or any other error, don't leave the child running unreaped
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+        
+        return proc.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+    
+    async def build_async(self, test_dir: str) -> Dict:
         """Build the test project"""
         try:
             # Create build directory
@@ -24,12 +132,12 @@ class BuildManager:
             os.makedirs(build_path, exist_ok=True)
             
             # Run cmake configure
-            cmake_result = self._run_cmake_configure(test_dir, build_path)
+            cmake_result = await self._run_cmake_configure(test_dir, build_path)
             if not cmake_result['success']:
                 return cmake_result
             
             # Run build
-            build_result = self._run_build(build_path)
+            build_result = await self._run_build(build_path)
             return build_result
             
         except Exception as e:
@@ -39,7 +147,7 @@ class BuildManager:
                 'log': f"Build failed with exception: {e}"
             }
     
-    def _run_cmake_configure(self, source_dir: str, build_dir: str) -> Dict:
+    async def _run_cmake_configure(self, source_dir: str, build_dir: str) -> Dict:
         """Run cmake configuration"""
         try:
             cmd = [
@@ -50,22 +158,17 @@ class BuildManager:
                 '-DCMAKE_BUILD_TYPE=Debug'
             ]
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
+            returncode, stdout, stderr = await self._run(cmd, timeout=120)
             
             return {
-                'success': result.returncode == 0,
-                'returncode': result.returncode,
-                'stdout': result.stdout,
-                'stderr': result.stderr,
-                'log': f"CMAKE STDOUT:\n{result.stdout}\n\nCMAKE STDERR:\n{result.stderr}"
+                'success': returncode == 0,
+                'returncode': returncode,
+                'stdout': stdout,
+                'stderr': stderr,
+                'log': f"CMAKE STDOUT:\n{stdout}\n\nCMAKE STDERR:\n{stderr}"
             }
             
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             return {
                 'success': False,
                 'error': 'CMake configuration timeout',
@@ -84,29 +187,47 @@ class BuildManager:
                 'log': f"CMake configuration failed: {e}"
             }
     
-    def _run_build(self, build_dir: str) -> Dict:
+    async def _run_build(self, build_dir: str) -> Dict:
         """Run the actual build"""
+        proc = None
         try:
             cmd = ['cmake', '--build', build_dir, '--config', 'Debug']
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300
+            # Stream the merged output so memory stays bounded on large build logs;
+            # only the tail is kept since that is where the errors are
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT
             )
+            tail = bytearray()
+            truncated = False
             
-            log = f"BUILD STDOUT:\n{result.stdout}\n\nBUILD STDERR:\n{result.stderr}"
+            async def _stream():
+                nonlocal truncated
+                # Read in chunks rather than lines, so no line is too long to read
+                while True:
+                    chunk = await proc.stdout.read(_BUILD_READ_SIZE)
+                    if not chunk:
+                        break
+                    tail.extend(chunk)
+                    if len(tail) > _BUILD_TAIL_BYTES:
+                        del tail[:len(tail) - _BUILD_TAIL_BYTES]
+                        truncated = True
+                return await proc.wait()
+            
+            returncode = await asyncio.wait_for(_stream(), timeout=300)
+            output = _decode_tail(tail, truncated)
             
             return {
-                'success': result.returncode == 0,
-                'returncode': result.returncode,
-                'stdout': result.stdout,
-                'stderr': result.stderr,
-                'log': log
+                'success': returncode == 0,
+                'returncode': returncode,
+                'stdout': output,
+                'stderr': '',
+                'log': f"BUILD OUTPUT:\n{output}"
             }
             
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             return {
                 'success': False,
                 'error': 'Build timeout',
@@ -118,8 +239,13 @@ class BuildManager:
                 'error': str(e),
                 'log': f"Build failed: {e}"
             }
+        finally:
+            # However the build ended, don't leave cmake running unreaped
+            if proc is not None and proc.returncode is None:
+                proc.kill()
+                await proc.wait()
     
-    def run_tests(self, test_dir: str) -> Dict:
+    async def run_tests_async(self, test_dir: str) -> Dict:
         """Run the compiled tests"""
         try:
             build_path = os.path.join(test_dir, self.build_dir)
@@ -134,23 +260,17 @@ class BuildManager:
                 }
             
             # Run tests
-            result = subprocess.run(
-                [test_executable],
-                capture_output=True,
-                text=True,
-                timeout=60,
-                cwd=build_path
-            )
+            returncode, stdout, stderr = await self._run([test_executable], timeout=60, cwd=build_path)
             
             return {
-                'success': result.returncode == 0,
-                'returncode': result.returncode,
-                'stdout': result.stdout,
-                'stderr': result.stderr,
-                'log': f"TEST STDOUT:\n{result.stdout}\n\nTEST STDERR:\n{result.stderr}"
+                'success': returncode == 0,
+                'returncode': returncode,
+                'stdout': stdout,
+                'stderr': stderr,
+                'log': f"TEST STDOUT:\n{stdout}\n\nTEST STDERR:\n{stderr}"
             }
             
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             return {
                 'success': False,
                 'error': 'Test timeout',
@@ -165,20 +285,23 @@ class BuildManager:
     
     def _find_test_executable(self, build_dir: str) -> Optional[str]:
         """Find the test executable in build directory"""
-        possible_names = ['run_tests', 'run_tests.exe', 'tests', 'tests.exe']
+        possible_names = frozenset({'run_tests', 'run_tests.exe', 'tests', 'tests.exe'})
         
-        for name in possible_names:
-            exe_path = os.path.join(build_dir, name)
-            if os.path.isfile(exe_path) and os.access(exe_path, os.X_OK):
-                return exe_path
-        
-        # Search recursively
-        for root, dirs, files in os.walk(build_dir):
-            for file in files:
-                if file in possible_names:
-                    exe_path = os.path.join(root, file)
-                    if os.access(exe_path, os.X_OK):
-                        return exe_path
+        # Breadth-first so the top level (where CMake places binaries) is checked first,
+        # skipping CMake's own bookkeeping trees and bounding the depth
+        queue = deque([(build_dir, 0)])
+        while queue:
+            directory, depth = queue.popleft()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if depth < 3 and entry.name not in {'CMakeFiles', '_deps'}:
+                                queue.append((entry.path, depth + 1))
+                        elif entry.name in possible_names and entry.is_file() and os.access(entry.path, os.X_OK):
+                            return entry.path
+            except OSError:
+                continue
         
         return None
     
@@ -186,14 +309,14 @@ class BuildManager:
         """Clean the build directory"""
         build_path = os.path.join(test_dir, self.build_dir)
         if os.path.exists(build_path):
-            shutil.rmtree(build_path)
+            _fast_rmtree(build_path)
     
     def check_dependencies(self) -> Dict:
         """Check if required build dependencies are available"""
         dependencies = {
-            'cmake': self._check_cmake(),
-            'compiler': self._check_compiler(),
-            'gtest': self._check_gtest()
+            'cmake': _check_cmake(),
+            'compiler': _check_compiler(),
+            'gtest': _check_gtest()
         }
         
         all_available = all(dependencies.values())
@@ -202,48 +325,3 @@ class BuildManager:
             'all_available': all_available,
             'dependencies': dependencies
         }
-    
-    def _check_cmake(self) -> bool:
-        """Check if CMake is available"""
-        try:
-            result = subprocess.run(['cmake', '--version'], capture_output=True)
-            return result.returncode == 0
-        except:
-            return False
-    
-    def _check_compiler(self) -> bool:
-        """Check if a C++ compiler is available"""
-        compilers = ['g++', 'clang++', 'cl']
-        
-        for compiler in compilers:
-            try:
-                result = subprocess.run([compiler, '--version'], capture_output=True)
-                if result.returncode == 0:
-                    return True
-            except:
-                continue
-        
-        return False
-    
-    def _check_gtest(self) -> bool:
-        """Check if Google Test is available"""
-        # This is a simplified check - in reality, you'd want to check
-        # if GTest can be found by CMake
-        try:
-            # Try to find gtest headers or library
-            common_paths = [
-                '/usr/include/gtest',
-                '/usr/local/include/gtest',
-                'C:/Program Files/googletest/include/gtest'
-            ]
-            
-            for path in common_paths:
-                if os.path.exists(path):
-                    return True
-            
-            # Try pkg-config
-            result = subprocess.run(['pkg-config', '--exists', 'gtest'], capture_output=True)
-            return result.returncode == 0
-            
-        except:
-            return False 
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""
+Console helpers shared by the command-line scripts
+"""
+
+import io
+import threading
+from contextlib import contextmanager
+
+class ThreadedStdout:
+    """stdout proxy that lets each worker thread collect its own output"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+    
+    def capture(self, func):
+        """Call func, returning its result and everything it printed"""
+        with self.capturing() as buffer:
+            return func(), buffer.getvalue()
+    
+    @contextmanager
+    def capturing(self):
+        """Collect this thread's output in a StringIO until the block exits
+        
+        Captures nest; the enclosing one resumes afterwards.
+        """
+        previous = getattr(self._local, 'buffer', None)
+        buffer = self._local.buffer = io.StringIO()
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = previous
+    
+    def write(self, text):
+        buffer = getattr(self._local, 'buffer', None)
+        return (self.stream if buffer is None else buffer).write(text)
+    
+    def flush(self):
+        self.stream.flush()
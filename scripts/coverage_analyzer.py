@@ -4,22 +4,26 @@ import os
 import subprocess
 import re
 import json
+import gzip
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional
 
+# Per-file summary line in gcov's text output
+_LINE_RE = re.compile(rb'Lines executed:(\d+\.\d+)% of (\d+)')
+
 class CoverageAnalyzer:
     """Analyzer for measuring test coverage"""
     
-    def __init__(self):
-        self.gcov_data_extensions = {'.gcda', '.gcno'}
-    
     def analyze(self, source_dir: str, test_dir: str) -> Dict:
         """Analyze test coverage"""
         try:
             build_dir = os.path.join(test_dir, "build")
             
-            # Check if coverage data exists
-            if not self._has_coverage_data(build_dir):
+            # Collect .gcda files in one pass; none means there is no coverage data
+            gcda_files = list(self._iter_gcda(build_dir)) if os.path.isdir(build_dir) else []
+            if not gcda_files:
                 return {
                     'error': 'No coverage data found',
                     'line_coverage': 0.0,
@@ -28,8 +32,13 @@ class CoverageAnalyzer:
                     'files': []
                 }
             
-            # Generate coverage report
-            coverage_data = self._generate_coverage_report(source_dir, build_dir)
+            # One gcov run with structured JSON output when gcov supports it
+            parsed_data = self._generate_json_coverage(gcda_files)
+            if parsed_data is not None:
+                return parsed_data
+            
+            # Older gcov: run it per file and parse the text summary
+            coverage_data = self._generate_coverage_report(gcda_files)
             
             # Parse coverage data
             parsed_data = self._parse_coverage_data(coverage_data, source_dir)
@@ -45,59 +54,120 @@ class CoverageAnalyzer:
                 'files': []
             }
     
-    def _has_coverage_data(self, build_dir: str) -> bool:
-        """Check if coverage data files exist"""
-        for root, dirs, files in os.walk(build_dir):
-            for file in files:
-                if Path(file).suffix in self.gcov_data_extensions:
-                    return True
-        return False
+    def _iter_gcda(self, directory: str):
+        """Yield the paths of all .gcda files under directory"""
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._iter_gcda(entry.path)
+                elif entry.name.endswith('.gcda'):
+                    yield entry.path
+    
+    def _generate_json_coverage(self, gcda_files: List[str]) -> Optional[Dict]:
+        """Run gcov once over all .gcda files and aggregate its JSON reports.
+        
+        Returns None if gcov does not support --json-format (GCC < 9).
+        """
+        try:
+            with tempfile.TemporaryDirectory() as report_dir:
+                result = subprocess.run(
+                    ['gcov', '--json-format', '--preserve-paths',
+                     *(os.path.abspath(gcda_file) for gcda_file in gcda_files)],
+                    capture_output=True,
+                    text=True,
+                    cwd=report_dir,
+                    timeout=120
+                )
+                
+                if result.returncode != 0:
+                    return None
+                
+                reports = list(Path(report_dir).glob('*.gcov.json.gz'))
+                if not reports:
+                    return None
+                
+                # A source (e.g. a header) can appear in several reports; a line
+                # counts as covered if any translation unit executed it
+                file_lines = {}
+                for report in reports:
+                    data = json.loads(gzip.decompress(report.read_bytes()))
+                    for file_data in data.get('files', []):
+                        lines = file_lines.setdefault(file_data['file'], {})
+                        for line in file_data.get('lines', []):
+                            number = line['line_number']
+                            lines[number] = lines.get(number, False) or line['count'] > 0
+            
+            return self._aggregate_line_coverage(file_lines)
+            
+        except subprocess.TimeoutExpired:
+            print("gcov timeout")
+        except Exception as e:
+            print(f"gcov JSON report failed: {e}")
+        
+        return None
+    
+    def _aggregate_line_coverage(self, file_lines: Dict[str, Dict[int, bool]]) -> Dict:
+        """Build the coverage result from per-file line coverage flags"""
+        result = {
+            'line_coverage': 0.0,
+            'branch_coverage': 0.0,
+            'function_coverage': 0.0,
+            'files': []
+        }
+        
+        total_lines = 0
+        covered_lines = 0
+        
+        for file_path, lines in sorted(file_lines.items()):
+            covered = sum(lines.values())
+            total_lines += len(lines)
+            covered_lines += covered
+            
+            result['files'].append({
+                'file': file_path,
+                'line_coverage': (covered / len(lines)) * 100 if lines else 0.0
+            })
+        
+        if total_lines > 0:
+            result['line_coverage'] = (covered_lines / total_lines) * 100
+        
+        return result
     
-    def _generate_coverage_report(self, source_dir: str, build_dir: str) -> str:
+    def _generate_coverage_report(self, gcda_files: List[str]) -> bytes:
         """Generate coverage report using gcov"""
         try:
-            # Find .gcda files
-            gcda_files = []
-            for root, dirs, files in os.walk(build_dir):
-                for file in files:
-                    if file.endswith('.gcda'):
-                        gcda_files.append(os.path.join(root, file))
+            # gcov runs are independent subprocesses, so threads can overlap them
+            with ThreadPoolExecutor(max_workers=min(32, len(gcda_files))) as executor:
+                outputs = list(executor.map(self._run_gcov, gcda_files))
             
-            if not gcda_files:
-                return ""
-            
-            # Run gcov on the files
-            coverage_output = ""
-            
-            for gcda_file in gcda_files:
-                try:
-                    # Change to the directory containing the .gcda file
-                    gcda_dir = os.path.dirname(gcda_file)
-                    
-                    # Run gcov
-                    result = subprocess.run(
-                        ['gcov', '-b', '-c', gcda_file],
-                        capture_output=True,
-                        text=True,
-                        cwd=gcda_dir,
-                        timeout=60
-                    )
-                    
-                    if result.returncode == 0:
-                        coverage_output += result.stdout + "\n"
-                    
-                except subprocess.TimeoutExpired:
-                    print(f"gcov timeout for {gcda_file}")
-                except Exception as e:
-                    print(f"gcov failed for {gcda_file}: {e}")
-            
-            return coverage_output
+            return b"\n".join(filter(None, outputs))
             
         except Exception as e:
             print(f"Error generating coverage report: {e}")
-            return ""
+            return b""
+    
+    def _run_gcov(self, gcda_file: str) -> bytes:
+        """Run gcov on a single .gcda file and return its output"""
+        try:
+            # Run gcov from the directory containing the .gcda file
+            result = subprocess.run(
+                ['gcov', '-b', '-c', gcda_file],
+                capture_output=True,
+                cwd=os.path.dirname(gcda_file),
+                timeout=60
+            )
+            
+            if result.returncode == 0:
+                return result.stdout
+            
+        except subprocess.TimeoutExpired:
+            print(f"gcov timeout for {gcda_file}")
+        except Exception as e:
+            print(f"gcov failed for {gcda_file}: {e}")
+        
+        return b""
     
-    def _parse_coverage_data(self, coverage_output: str, source_dir: str) -> Dict:
+    def _parse_coverage_data(self, coverage_output: bytes, source_dir: str) -> Dict:
         """Parse gcov output to extract coverage information"""
         result = {
             'line_coverage': 0.0,
@@ -110,19 +180,15 @@ class CoverageAnalyzer:
             return result
         
         try:
-            lines = coverage_output.split('\n')
             total_lines = 0
             covered_lines = 0
             
-            for line in lines:
-                if 'Lines executed:' in line:
-                    match = re.search(r"Lines executed:(\d+\.\d+)% of (\d+)", line)
-                    if match:
-                        percent = float(match.group(1))
-                        count = int(match.group(2))
-                        
-                        total_lines += count
-                        covered_lines += int(count * percent / 100)
+            for match in _LINE_RE.finditer(coverage_output):
+                percent = float(match.group(1))
+                count = int(match.group(2))
+                
+                total_lines += count
+                covered_lines += int(count * percent / 100)
             
             if total_lines > 0:
                 result['line_coverage'] = (covered_lines / total_lines) * 100
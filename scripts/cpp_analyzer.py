@@ -2,136 +2,443 @@
 C++ Analyzer for finding and analyzing C++ source files
 """
 
+import atexit
+import bisect
+import functools
+import mmap
 import os
+import pickle
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
-class CppAnalyzer:
-    """Analyzer for C++ source files"""
+# Single pattern covering everything analyze_file extracts, so the content is
+# scanned once. The function alternative is a simplified pattern - real C++
+# parsing is much more complex. Patterns are bytes so they run directly on mmap'ed files
+_COMBINED_RE = re.compile(
+    rb'(?P<include>#include\s*[<"](?P<include_name>[^>"]+)[>"])'
+    rb'|(?P<namespace>namespace\s+(?P<namespace_name>\w+)\s*{)'
+    rb'|(?P<class>class\s+(?P<class_name>\w+)(?:\s*:\s*(?:public|private|protected)\s+[\w:]+)?\s*{)'
+    rb'|(?P<function>(?P<return_type>\w+\s+)*(?P<function_name>\w+)\s*\(\s*(?P<parameters>[^)]*)\s*\)\s*'
+    rb'(?:const\s*)?(?:override\s*)?(?:final\s*)?(?:noexcept\s*)?(?:\s*->\s*\w+)?\s*{)',
+    re.MULTILINE
+)
+_NEWLINE_RE = re.compile(rb'\n')
+
+CPP_EXTENSIONS = frozenset({'.cpp', '.cc', '.cxx', '.c++'})
+HEADER_EXTENSIONS = frozenset({'.h', '.hpp', '.hxx', '.h++'})
+
+# Keywords the function pattern can match that aren't function names
+_CPP_KEYWORD_NAMES = frozenset({
+    'if', 'for', 'while', 'switch', 'catch', 'class', 'struct', 'enum',
+    'return', 'sizeof', 'typedef', 'typename', 'template', 'operator'
+})
+
+def _analyze_file(file_path: str) -> Dict:
+    """Analyze a C++ file for functions, classes, etc.
     
-    def __init__(self):
-        self.cpp_extensions = {'.cpp', '.cc', '.cxx', '.c++'}
-        self.header_extensions = {'.h', '.hpp', '.hxx', '.h++'}
+    Module-level so it can be shipped to worker processes.
+    """
+    try:
+        result = {'file_path': file_path}
         
-    def find_cpp_files(self, directory: str) -> List[str]:
-        """Find all C++ source files in directory"""
-        cpp_files = []
+        # Map the file instead of reading it so only matched text is ever decoded
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                result.update(_extract_all(b''))
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    result.update(_extract_all(content))
         
-        for root, dirs, files in os.walk(directory):
-            # Skip common build directories
-            dirs[:] = [d for d in dirs if d not in {'build', 'cmake-build-debug', 'cmake-build-release', '.git'}]
-            
-            for file in files:
-                if Path(file).suffix in self.cpp_extensions:
-                    cpp_files.append(os.path.join(root, file))
-                    
-        return sorted(cpp_files)
+        return result
+    except Exception as e:
+        return {
+            'file_path': file_path,
+            'error': str(e),
+            'functions': [],
+            'classes': [],
+            'includes': [],
+            'namespaces': []
+        }
+
+def _decode(value: bytes) -> str:
+    """Decode a captured byte string from a source file"""
+    return value.decode('utf-8', 'ignore')
+
+# Pieces of a declaration head that decide how extract_public_api treats a block
+_BLOCK_COMMENT_RE = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+_LEADING_COMMENTS_RE = re.compile(r'(?:\s+|//[^\n]*|/\*.*?\*/)*', re.DOTALL)
+_ACCESS_LABEL_RE = re.compile(r'^\s*(?:(?:public|private|protected)\s*:(?!:)\s*)+')
+_SCOPE_HEAD_RE = re.compile(
+    r'^(?:template\s*<[^{}]*>\s*)?(?:(?:class|struct|union)\b[^=(){}]*|(?:inline\s+)?namespace\b[\w:\s]*|extern\s*"[^"]*"\s*)$'
+)
+_FUNCTION_HEAD_RE = re.compile(
+    r'\)\s*(?:const\b\s*|volatile\b\s*|noexcept\b\s*(?:\([^)]*\)\s*)?|override\b\s*|final\b\s*|&{1,2}\s*|->[^;{}]*)*$'
+)
+_INITIALIZER_LIST_RE = re.compile(r'\)\s*(?:noexcept\b\s*)?(?P<cut>:)(?!:)')
+_FUNCTION_TRY_RE = re.compile(
+    r'\)\s*(?:const\b\s*|volatile\b\s*|noexcept\b\s*|override\b\s*|final\b\s*|&{1,2}\s*|->[^;{}]*?)*(?P<cut>\btry\b)'
+)
+_CATCH_RE = re.compile(r'catch\s*\(')
+_LAMBDA_HEAD_RE = re.compile(
+    r'\[[^\[\]]*\]\s*(?:<[^<>]*>\s*)?\([^()]*\)\s*(?:mutable\b\s*|constexpr\b\s*|noexcept\b\s*|->[^;{}]*)*$'
+)
+_LOCAL_INCLUDE_RE = re.compile(r'^\s*#\s*include\s*"([^"]+)"', re.MULTILINE)
+_BLANK_LINES_RE = re.compile(r'\n\s*\n(?:\s*\n)+')
+
+def _skip_literal(text: str, i: int) -> int:
+    """Index just past the comment, literal or preprocessor line at i, or i itself"""
+    char = text[i]
+    if char == '/' and text.startswith('//', i):
+        end = text.find('\n', i)
+        return len(text) if end < 0 else end
+    if char == '/' and text.startswith('/*', i):
+        end = text.find('*/', i + 2)
+        return len(text) if end < 0 else end + 2
+    if char == 'R' and text.startswith('R"', i) and not (i and (text[i - 1].isalnum() or text[i - 1] == '_')):
+        open_paren = text.find('(', i + 2)
+        if open_paren >= 0:
+            end = text.find(')' + text[i + 2:open_paren] + '"', open_paren)
+            return len(text) if end < 0 else end + open_paren - i
+    if char == '"' or (char == "'" and not (i and text[i - 1].isalnum())):
+        # A quote after an alphanumeric is a digit separator, as in 1'000
+        j = i + 1
+        while j < len(text) and text[j] != char and text[j] != '\n':
+            j += 2 if text[j] == '\\' else 1
+        return j + 1
+    if char == '#' and text[text.rfind('\n', 0, i) + 1:i].strip() == '':
+        # Preprocessor lines, including backslash continuations
+        j = i
+        while True:
+            end = text.find('\n', j)
+            if end < 0:
+                return len(text)
+            if not text[end - 1:end] == '\\':
+                return end
+            j = end + 1
+    return i
+
+def _matching_brace(text: str, i: int) -> int:
+    """Index just past the brace that closes the one at i"""
+    depth = 0
+    while i < len(text):
+        skipped = _skip_literal(text, i)
+        if skipped != i:
+            i = skipped
+            continue
+        if text[i] == '{':
+            depth += 1
+        elif text[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return len(text)
+
+def _strip_bodies(text: str) -> str:
+    """Replace function bodies with ';', keeping everything at namespace and class scope
     
-    def find_header_files(self, directory: str) -> List[str]:
-        """Find all C++ header files in directory"""
-        header_files = []
+    Class heads, access labels, member declarations, comments and closing braces
+    survive, so the result reads like a header for the file.
+    """
+    parts = []
+    statement_start = 0
+    i = 0
+    
+    while i < len(text):
+        skipped = _skip_literal(text, i)
+        if skipped != i:
+            if text[i] == '#':
+                # A preprocessor line ends the statement before it
+                parts.append(text[statement_start:skipped])
+                statement_start = skipped
+            i = skipped
+            continue
         
-        for root, dirs, files in os.walk(directory):
-            dirs[:] = [d for d in dirs if d not in {'build', 'cmake-build-debug', 'cmake-build-release', '.git'}]
+        char = text[i]
+        if char == '{':
+            head = _ACCESS_LABEL_RE.sub('', _BLOCK_COMMENT_RE.sub('', text[statement_start:i])).strip()
+            lambda_head = _LAMBDA_HEAD_RE.search(head)
+            if lambda_head and head[:lambda_head.start()].rstrip().endswith('operator'):
+                # operator[](...) is a function, not a lambda
+                lambda_head = None
             
-            for file in files:
-                if Path(file).suffix in self.header_extensions:
-                    header_files.append(os.path.join(root, file))
-                    
-        return sorted(header_files)
-    
-    def analyze_file(self, file_path: str) -> Dict:
-        """Analyze a C++ file for functions, classes, etc."""
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+            if _SCOPE_HEAD_RE.match(head):
+                # Namespace, class or linkage block: keep its head and walk its contents
+                parts.append(text[statement_start:i + 1])
+                statement_start = i + 1
+            elif not lambda_head and (_FUNCTION_HEAD_RE.search(head) or (
+                    # After a constructor's initializers or a function-try-block's try,
+                    # unlike inside an initializer as in v_{1, 2}
+                    (_INITIALIZER_LIST_RE.search(head) or _FUNCTION_TRY_RE.search(head))
+                    and head.endswith((')', '}', 'try')))):
+                # Function definition: keep the signature, dropping any try and
+                # constructor initializers
+                signature = text[statement_start:i]
+                code_start = _LEADING_COMMENTS_RE.match(signature).end()
+                cut = _FUNCTION_TRY_RE.search(signature, code_start) or \
+                    _INITIALIZER_LIST_RE.search(signature, code_start)
+                if cut:
+                    signature = signature[:cut.start('cut')]
+                parts.append(signature.rstrip() + ';')
+                i = _matching_brace(text, i)
                 
-            return {
-                'file_path': file_path,
-                'functions': self._extract_functions(content),
-                'classes': self._extract_classes(content),
-                'includes': self._extract_includes(content),
-                'namespaces': self._extract_namespaces(content)
-            }
-        except Exception as e:
-            return {
-                'file_path': file_path,
-                'error': str(e),
-                'functions': [],
-                'classes': [],
-                'includes': [],
-                'namespaces': []
-            }
-    
-    def _extract_functions(self, content: str) -> List[Dict]:
-        """Extract function definitions from C++ code"""
-        functions = []
-        
-        # Pattern for function definitions
-        # This is a simplified pattern - real C++ parsing is much more complex
-        function_pattern = r'(\w+\s+)*(\w+)\s*\(\s*([^)]*)\s*\)\s*(?:const\s*)?(?:override\s*)?(?:final\s*)?(?:noexcept\s*)?(?:\s*->\s*\w+)?\s*{'
-        
-        matches = re.finditer(function_pattern, content, re.MULTILINE)
-        
-        for match in matches:
+                # A function-try-block's handlers belong to the body too
+                while _FUNCTION_TRY_RE.search(head):
+                    handler = _CATCH_RE.match(text, _LEADING_COMMENTS_RE.match(text, i).end())
+                    if not handler:
+                        break
+                    i = _matching_brace(text, text.find('{', handler.end()))
+                
+                statement_start = i
+                continue
+            else:
+                # Enum, brace initializer or lambda: part of the statement, kept whole
+                i = _matching_brace(text, i)
+                continue
+        elif char in ';}':
+            parts.append(text[statement_start:i + 1])
+            statement_start = i + 1
+        i += 1
+    
+    parts.append(text[statement_start:])
+    return _BLANK_LINES_RE.sub('\n\n', ''.join(parts)).strip()
+
+def _extract_all(content) -> Dict:
+    """Extract functions, classes, includes and namespaces in one pass"""
+    functions = []
+    classes = []
+    includes = set()
+    namespaces = set()
+    
+    # Offsets of every newline, so line numbers are a binary search. Built on
+    # first use, since files with only declarations never need a line number
+    newlines = None
+    
+    def line_of(offset: int) -> int:
+        nonlocal newlines
+        if newlines is None:
+            newlines = [m.start() for m in _NEWLINE_RE.finditer(content)]
+        return bisect.bisect_left(newlines, offset) + 1
+    
+    for match in _COMBINED_RE.finditer(content):
+        kind = match.lastgroup
+        
+        if kind == 'function':
             # Skip common C++ keywords that aren't function names
-            function_name = match.group(2)
-            if function_name in {'if', 'for', 'while', 'switch', 'catch', 'class', 'struct', 'enum'}:
+            function_name = _decode(match.group('function_name'))
+            if function_name in _CPP_KEYWORD_NAMES:
                 continue
                 
+            return_type = match.group('return_type')
             functions.append({
                 'name': function_name,
-                'parameters': match.group(3).strip(),
-                'return_type': match.group(1).strip() if match.group(1) else 'auto',
-                'line': content[:match.start()].count('\n') + 1
+                'parameters': _decode(match.group('parameters')).strip(),
+                'return_type': _decode(return_type).strip() if return_type else 'auto',
+                'line': line_of(match.start())
             })
-            
-        return functions
+        elif kind == 'class':
+            classes.append({
+                'name': _decode(match.group('class_name')),
+                'line': line_of(match.start())
+            })
+        elif kind == 'include':
+            includes.add(_decode(match.group('include_name')))
+        elif kind == 'namespace':
+            namespaces.add(_decode(match.group('namespace_name')))
+    
+    return {
+        'functions': functions,
+        'classes': classes,
+        'includes': list(includes),
+        'namespaces': list(namespaces)
+    }
+
+class _AnalysisCache:
+    """Analyses persisted across runs, keyed by absolute path
     
-    def _extract_classes(self, content: str) -> List[Dict]:
-        """Extract class definitions from C++ code"""
-        classes = []
+    Each entry stores the (mtime_ns, size) it was made at, so an edited file
+    replaces its old entry rather than adding another.
+    """
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = self._load()
+        self._dirty = set()
+        atexit.register(self.save)
+    
+    def _load(self) -> Dict:
+        """Load cached analyses from disk"""
+        try:
+            with open(self.path, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return {}
+    
+    def get(self, path: str, stamp: Tuple[int, int]) -> Optional[Dict]:
+        """Cached analysis of path, if it was made at stamp"""
+        entry = self.entries.get(path)
+        return entry[1] if entry is not None and entry[0] == stamp else None
+    
+    def put(self, path: str, stamp: Tuple[int, int], analysis: Dict):
+        """Store the analysis of path as made at stamp"""
+        self.entries[path] = (stamp, analysis)
+        self._dirty.add(path)
+    
+    def save(self):
+        """Persist changed entries, merged into whatever is on disk now"""
+        if not self._dirty:
+            return
         
-        # Pattern for class definitions
-        class_pattern = r'class\s+(\w+)(?:\s*:\s*(?:public|private|protected)\s+[\w:]+)?\s*{'
+        # Another process may have saved since this one loaded
+        entries = self._load()
+        entries.update((path, self.entries[path]) for path in self._dirty)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._dirty.clear()
+        except OSError as e:
+            print(f"Could not save analysis cache: {e}")
+    
+    def clear(self):
+        """Drop all cached analyses, in memory and on disk"""
+        self.entries.clear()
+        self._dirty.clear()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+@functools.lru_cache(maxsize=None)
+def _get_analysis_cache() -> _AnalysisCache:
+    """Analysis cache shared by every CppAnalyzer in the process"""
+    return _AnalysisCache(Path.home() / '.cache' / 'cpp_utgen' / 'analyze.pkl')
+
+class CppAnalyzer:
+    """Analyzer for C++ source files"""
+    
+    def __init__(self):
+        self.cpp_extensions = CPP_EXTENSIONS
+        self.header_extensions = HEADER_EXTENSIONS
         
-        matches = re.finditer(class_pattern, content, re.MULTILINE)
+        # Unchanged files are not re-parsed, in this run or later ones
+        self._cache = _get_analysis_cache()
         
-        for match in matches:
-            classes.append({
-                'name': match.group(1),
-                'line': content[:match.start()].count('\n') + 1
-            })
-            
-        return classes
+    def _scan(self, directory: str):
+        """Yield (path, suffix) for every file under directory in a single pass"""
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    # Skip common build directories
+                    if entry.name not in {'build', 'cmake-build-debug', 'cmake-build-release', '.git'}:
+                        yield from self._scan(entry.path)
+                elif entry.is_file():
+                    yield entry.path, os.path.splitext(entry.name)[1]
+    
+    def find_cpp_files(self, directory: str) -> List[str]:
+        """Find all C++ source files in directory"""
+        return sorted(path for path, suffix in self._scan(directory) if suffix in self.cpp_extensions)
+    
+    def find_header_files(self, directory: str) -> List[str]:
+        """Find all C++ header files in directory"""
+        return sorted(path for path, suffix in self._scan(directory) if suffix in self.header_extensions)
     
-    def _extract_includes(self, content: str) -> List[str]:
-        """Extract include statements from C++ code"""
-        includes = []
+    def analyze_file(self, file_path: str) -> Dict:
+        """Analyze a C++ file for functions, classes, etc."""
+        key = self._cache_key(file_path)
+        cached = self._cache.get(*key) if key is not None else None
+        if cached is not None:
+            return {**cached, 'file_path': file_path}
         
-        # Pattern for include statements
-        include_pattern = r'#include\s*[<"]([^>"]+)[>"]'
+        analysis = _analyze_file(file_path)
+        self._remember(key, analysis)
+        return analysis
+    
+    def local_headers(self, file_path: str, content: Optional[str] = None) -> List[str]:
+        """Paths of this project's headers that a file includes
         
-        matches = re.findall(include_pattern, content)
+        These are the quoted includes that resolve next to the file.
+        """
+        if content is None:
+            with open(file_path, 'r', errors='ignore') as f:
+                content = f.read()
         
-        return list(set(matches))  # Remove duplicates
+        base_dir = os.path.dirname(file_path)
+        header_paths = (os.path.join(base_dir, name) for name in _LOCAL_INCLUDE_RE.findall(content))
+        return [header_path for header_path in header_paths if os.path.isfile(header_path)]
     
-    def _extract_namespaces(self, content: str) -> List[str]:
-        """Extract namespace declarations from C++ code"""
-        namespaces = []
+    def extract_public_api(self, file_path: str) -> str:
+        """Summarize a C++ file as its local headers and its source without function bodies
         
-        # Pattern for namespace declarations
-        namespace_pattern = r'namespace\s+(\w+)\s*{'
+        Namespaces, classes with their access labels and members, and the comments
+        above each definition are kept.
+        """
+        with open(file_path, 'r', errors='ignore') as f:
+            content = f.read()
         
-        matches = re.findall(namespace_pattern, content)
+        parts = []
+        for header_path in self.local_headers(file_path, content):
+            with open(header_path, 'r', errors='ignore') as f:
+                parts.append(f"// {os.path.basename(header_path)}\n{f.read().strip()}\n")
         
-        return list(set(matches))  # Remove duplicates
+        parts.append(f"// {os.path.basename(file_path)} (function bodies omitted)")
+        parts.append(_strip_bodies(content))
+        return '\n'.join(parts)
+    
+    def _cache_key(self, file_path: str) -> Optional[Tuple[str, Tuple[int, int]]]:
+        """(absolute path, (mtime_ns, size)) of a file, or None if it can't be stat'ed"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return os.path.abspath(file_path), (st.st_mtime_ns, st.st_size)
+    
+    def _remember(self, key: Optional[Tuple[str, Tuple[int, int]]], analysis: Dict):
+        """Store a successful analysis in the cache"""
+        if key is not None and 'error' not in analysis:
+            self._cache.put(*key, analysis)
+    
+    def clear_cache(self):
+        """Drop all cached analyses, in memory and on disk"""
+        self._cache.clear()
+    
+    def _iter_all(self, directory: str):
+        """Yield (path, kind) for every C++ file, kind being 'cpp' or 'header'"""
+        for path, suffix in self._scan(directory):
+            if suffix in self.cpp_extensions:
+                yield path, 'cpp'
+            elif suffix in self.header_extensions:
+                yield path, 'header'
     
     def get_project_info(self, directory: str) -> Dict:
         """Get overall project information"""
-        cpp_files = self.find_cpp_files(directory)
-        header_files = self.find_header_files(directory)
+        cpp_files = []
+        header_files = []
+        keys = {}
+        analyses = {}
+        pending = {}
+        
+        # Walk the tree once, handing every uncached file to the pool as soon as
+        # it is found so parsing overlaps the rest of the walk. Headers are parsed
+        # too, for the include graph
+        with ProcessPoolExecutor() as executor:
+            for path, kind in self._iter_all(directory):
+                (cpp_files if kind == 'cpp' else header_files).append(path)
+                
+                keys[path] = self._cache_key(path)
+                cached = self._cache.get(*keys[path]) if keys[path] is not None else None
+                if cached is not None:
+                    analyses[path] = cached
+                else:
+                    pending[path] = executor.submit(_analyze_file, path)
+            
+            for path, future in pending.items():
+                analyses[path] = future.result()
+                self._remember(keys[path], analyses[path])
         
         total_functions = 0
         total_classes = 0
@@ -139,7 +446,7 @@ class CppAnalyzer:
         all_namespaces = set()
         
         for cpp_file in cpp_files:
-            analysis = self.analyze_file(cpp_file)
+            analysis = analyses[cpp_file]
             total_functions += len(analysis['functions'])
             total_classes += len(analysis['classes'])
             all_includes.update(analysis['includes'])
@@ -151,5 +458,6 @@ class CppAnalyzer:
             'total_functions': total_functions,
             'total_classes': total_classes,
             'common_includes': list(all_includes),
-            'namespaces': list(all_namespaces)
-        } 
\ No newline at end of file
+            'namespaces': list(all_namespaces),
+            'include_graph': {path: sorted(analyses[path]['includes']) for path in sorted(analyses)}
+        }
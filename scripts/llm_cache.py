@@ -0,0 +1,44 @@
+"""
+Persistent cache for LLM responses
+Entries are keyed by a hash of everything that determines the response
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+class LLMCache:
+    """Content-addressed LLM response cache backed by SQLite"""
+    
+    def __init__(self, directory: str = '.llm_cache'):
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, 'responses.db'), check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(**fields) -> str:
+        """Hash the request fields into a cache key"""
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, if any"""
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM responses WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+    
+    def set(self, key: str, value: str):
+        """Store a response under key"""
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO responses (key, value) VALUES (?, ?)', (key, value))
+            self._conn.commit()
+    
+    def clear(self):
+        """Remove all cached responses"""
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
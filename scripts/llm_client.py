@@ -3,10 +3,44 @@ LLM Client for communicating with different AI models
 Supports Ollama, OpenAI, and GitHub Models
 """
 
-import requests
+import asyncio
+import importlib.util
+import itertools
+import random
 import json
+import sqlite3
+import threading
 import time
-from typing import Dict, Optional, Any
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple, Any
+
+from scripts.llm_cache import LLMCache
+
+# orjson parses response bodies several times faster when it is installed
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+# How long a test_connection() result is reused before probing again
+_CONNECTION_TTL = 30.0
+
+def _http2_available() -> bool:
+    """Whether httpx can speak HTTP/2, which needs the optional h2 package"""
+    return importlib.util.find_spec('h2') is not None
+
+def _code_block_closed(fragments: List[str]) -> bool:
+    """Whether the streamed fragments so far contain a complete fenced code block"""
+    # A fence can only be completed by a fragment that contains a backtick
+    return '`' in fragments[-1] and ''.join(fragments).count('```') >= 2
+
+class LLMAPIError(Exception):
+    """Error response from an LLM provider"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
 
 class LLMClient:
     """Client for interacting with various LLM providers"""
@@ -16,107 +50,503 @@ class LLMClient:
         self.provider = config['llm_settings']['provider']
         self.request_settings = config['llm_settings'].get('request_settings', {})
         
-    def generate(self, prompt: str) -> Optional[str]:
-        """Generate text using the configured LLM"""
-        max_retries = self.request_settings.get('max_retries', 3)
-        retry_delay = self.request_settings.get('retry_delay', 2)
+        # Pick the provider once: only its SDK is imported and generate() calls
+        # the bound implementation directly, so the retry loop is provider-agnostic
+        providers = {
+            'ollama': (self._init_ollama, self._generate_ollama, self._agenerate_ollama),
+            'openai': (self._init_openai, self._generate_openai, self._agenerate_openai),
+            'github': (self._init_github, self._generate_github, self._agenerate_github),
+        }
+        if self.provider not in providers:
+            raise ValueError(f"Unsupported provider: {self.provider}")
+        
+        self._session = None
+        self._github_http = None
+        self._openai = None
+        self._openai_clients = []
+        
+        # Ollama base_url and OpenAI api_key may each be a list of backends
+        self._endpoints = [None]
+        
+        init, self._impl, self._aimpl = providers[self.provider]
+        init(config['llm_settings'][self.provider])
+        
+        # Requests go to the backend with the fewest in flight, rotating between ties
+        self._in_flight = [0] * len(self._endpoints)
+        self._rotation = itertools.count()
+        # generate() runs on worker threads, so the counts are updated under a lock
+        self._in_flight_lock = threading.Lock()
+        
+        # Responses are near-deterministic at low temperature, so identical
+        # requests are served from a persistent cache, opened on first use
+        self._cache = None
+        self._cache_enabled = config['llm_settings'].get('cache', True)
+        
+        # Async clients are created on first use and released by aclose()
+        self._async_http = None
+        self._async_github = None
+        self._async_openai = None
+        
+        # (checked_at, result) of the last test_connection() call
+        self._connection_status = None
+        
+    def _init_ollama(self, ollama_config: Dict):
+        """Set up the pooled session and backend list for Ollama"""
+        self._endpoints = self._as_list(ollama_config.get('base_urls') or ollama_config['base_url'])
+        self._session = self._create_session()
+    
+    def _init_openai(self, openai_config: Dict):
+        """Set up one persistent OpenAI client per API key"""
+        import httpx
+        import openai
+        
+        # Persistent clients whose connection pools outlive a single request
+        self._openai = openai
+        self._openai_limits = httpx.Limits(
+            max_connections=openai_config.get('max_connections', 200),
+            max_keepalive_connections=openai_config.get('max_keepalive_connections', 100)
+        )
+        self._endpoints = self._as_list(openai_config['api_key'])
+        self._openai_clients = [
+            openai.OpenAI(api_key=api_key, http_client=httpx.Client(limits=self._openai_limits))
+            for api_key in self._endpoints
+        ]
+    
+    def _init_github(self, github_config: Dict):
+        """Set up the authenticated HTTP client for GitHub Models"""
+        import httpx
+        
+        self._github_http = httpx.Client(**self._github_client_options(github_config))
+    
+    @staticmethod
+    def _github_client_options(github_config: Dict) -> Dict:
+        """Settings shared by the sync and async GitHub Models clients"""
+        import httpx
+        
+        # HTTP/2 multiplexes concurrent requests over a single TLS connection
+        return {
+            'http2': _http2_available(),
+            'timeout': github_config.get('timeout', 300),
+            'limits': httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            'headers': {
+                "Authorization": f"Bearer {github_config['api_key']}",
+                "Content-Type": "application/json"
+            }
+        }
+    
+    def _create_session(self):
+        """Create a pooled HTTP session so keep-alive connections are reused across requests"""
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=self.request_settings.get('pool_maxsize', 32)
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
+    @staticmethod
+    def _as_list(value) -> List:
+        """Wrap a single config value in a list"""
+        return list(value) if isinstance(value, (list, tuple)) else [value]
+    
+    @contextmanager
+    def _endpoint(self):
+        """Reserve the least busy backend and yield its index"""
+        count = len(self._endpoints)
+        with self._in_flight_lock:
+            start = next(self._rotation) % count
+            index = min(
+                ((start + offset) % count for offset in range(count)),
+                key=self._in_flight.__getitem__
+            )
+            self._in_flight[index] += 1
         
-        for attempt in range(max_retries):
+        try:
+            yield index
+        finally:
+            with self._in_flight_lock:
+                self._in_flight[index] -= 1
+    
+    def generate(self, prompt: str, use_cache: bool = True,
+                 stop_at_code_block: bool = False) -> Optional[str]:
+        """Generate text using the configured LLM
+        
+        With stop_at_code_block the reply is cut off once its first fenced code
+        block closes, skipping any explanation the model adds afterwards.
+        """
+        key, cached = self._cache_lookup(prompt, use_cache, stop_at_code_block)
+        if cached is not None:
+            return cached
+        
+        for attempt in range(self.request_settings.get('max_retries', 3)):
             try:
-                if self.provider == 'ollama':
-                    return self._generate_ollama(prompt)
-                elif self.provider == 'openai':
-                    return self._generate_openai(prompt)
-                elif self.provider == 'github':
-                    return self._generate_github(prompt)
-                else:
-                    raise ValueError(f"Unsupported provider: {self.provider}")
+                response = self._impl(prompt, stop_at_code_block)
+                self._cache_store(key, response)
+                return response
                     
             except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                else:
-                    print(f"All attempts failed for provider: {self.provider}")
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    break
+                time.sleep(delay)
                     
         return None
     
-    def _generate_ollama(self, prompt: str) -> Optional[str]:
-        """Generate using Ollama"""
-        config = self.config['llm_settings']['ollama']
+    async def agenerate(self, prompt: str, use_cache: bool = True,
+                        stop_at_code_block: bool = False) -> Optional[str]:
+        """Generate text using the configured LLM without blocking the event loop"""
+        key, cached = self._cache_lookup(prompt, use_cache, stop_at_code_block)
+        if cached is not None:
+            return cached
+        
+        for attempt in range(self.request_settings.get('max_retries', 3)):
+            try:
+                response = await self._aimpl(prompt, stop_at_code_block)
+                self._cache_store(key, response)
+                return response
+                    
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+                    
+        return None
+    
+    def _get_cache(self) -> Optional[LLMCache]:
+        """Return the response cache, opening it on first use, or None if caching is off"""
+        if self._cache is None and self._cache_enabled:
+            try:
+                self._cache = LLMCache(self.config['llm_settings'].get('cache_dir', '.llm_cache'))
+            except (OSError, sqlite3.Error) as e:
+                # The cache is only an optimisation, so carry on without it
+                print(f"LLM response cache unavailable: {e}")
+                self._cache_enabled = False
+        return self._cache
+    
+    def _cache_lookup(self, prompt: str, use_cache: bool,
+                      stop_at_code_block: bool) -> Tuple[Optional[str], Optional[str]]:
+        """(cache key, cached response) for a request; the key is None when not caching"""
+        cache = self._get_cache() if use_cache else None
+        if cache is None:
+            return None, None
+        
+        key = self._cache_key(prompt, stop_at_code_block)
+        try:
+            return key, cache.get(key)
+        except sqlite3.Error as e:
+            print(f"LLM response cache read failed: {e}")
+            return key, None
+    
+    def _cache_store(self, key: Optional[str], response: Optional[str]):
+        """Cache a non-empty response under the key from _cache_lookup"""
+        if key is not None and response:
+            try:
+                self._cache.set(key, response)
+            except sqlite3.Error as e:
+                print(f"LLM response cache write failed: {e}")
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Report a failed attempt and return the seconds to wait, or None to give up"""
+        print(f"Attempt {attempt + 1} failed: {error}")
+        
+        delay = self._backoff(error, attempt, self.request_settings.get('retry_delay', 2))
+        if delay is not None and attempt >= self.request_settings.get('max_retries', 3) - 1:
+            print(f"All attempts failed for provider: {self.provider}")
+            return None
+        return delay
+    
+    def _backoff(self, error: Exception, attempt: int, retry_delay: float) -> Optional[float]:
+        """Seconds to wait before retrying after error, or None to give up"""
+        status = getattr(error, 'status_code', None)
+        
+        # Client errors other than rate limiting won't succeed on retry
+        if status is not None and 400 <= status < 500 and status != 429:
+            return None
         
-        url = f"{config['base_url']}/api/generate"
-        payload = {
-            "model": config['model'],
+        delay = min(retry_delay * 2 ** attempt, self.request_settings.get('max_retry_delay', 60))
+        
+        # Honour the server's Retry-After (in seconds) when rate limited
+        if status == 429:
+            try:
+                delay = float(getattr(error, 'retry_after', None))
+            except (TypeError, ValueError):
+                pass
+        
+        # Jitter so concurrent requests don't retry in lockstep
+        return delay + random.uniform(0, delay * 0.3)
+    
+    def _sampling_settings(self) -> Dict:
+        """Section holding temperature and max_tokens for the provider"""
+        # OpenAI reads sampling settings from its own section, the others from request_settings
+        if self.provider == 'openai':
+            return self.config['llm_settings']['openai']
+        return self.request_settings
+    
+    def _cache_key(self, prompt: str, stop_at_code_block: bool = False) -> str:
+        """Cache key covering everything that determines the response"""
+        provider_config = self.config['llm_settings'].get(self.provider, {})
+        settings = self._sampling_settings()
+        
+        return LLMCache.make_key(
+            provider=self.provider,
+            model=provider_config.get('model'),
+            prompt=prompt,
+            temperature=settings.get('temperature', 0.1),
+            max_tokens=settings.get('max_tokens', 4096),
+            stop_at_code_block=stop_at_code_block
+        )
+    
+    def _ollama_payload(self, prompt: str) -> Dict:
+        """Streaming request body for Ollama's /api/generate"""
+        return {
+            "model": self.config['llm_settings']['ollama']['model'],
             "prompt": prompt,
-            "stream": False,
+            "stream": True,
             "options": {
                 "temperature": self.request_settings.get('temperature', 0.1),
                 "num_predict": self.request_settings.get('max_tokens', 4096)
             }
         }
-        
-        response = requests.post(
-            url, 
-            json=payload, 
-            timeout=config.get('timeout', 300)
+    
+    def _chat_payload(self, prompt: str) -> Dict:
+        """Streaming chat completion request for OpenAI and GitHub Models"""
+        settings = self._sampling_settings()
+        return {
+            "model": self.config['llm_settings'][self.provider]['model'],
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": settings.get('max_tokens', 4096),
+            "temperature": settings.get('temperature', 0.1),
+            "stream": True
+        }
+    
+    @staticmethod
+    def _check_status(response, provider_name: str):
+        """Raise LLMAPIError unless the HTTP response succeeded"""
+        if response.status_code != 200:
+            raise LLMAPIError(f"{provider_name} API error: {response.status_code}",
+                              response.status_code, response.headers.get('Retry-After'))
+    
+    @staticmethod
+    def _read_ollama_line(line: str, fragments: List[str]) -> bool:
+        """Append the text of one Ollama stream line; True once the reply is done"""
+        if not line:
+            return False
+        chunk = _json_loads(line)
+        fragments.append(chunk.get('response', ''))
+        return bool(chunk.get('done'))
+    
+    @staticmethod
+    def _read_openai_chunk(chunk, fragments: List[str]) -> bool:
+        """Append the text of one OpenAI stream chunk; True if it added any"""
+        if chunk.choices and chunk.choices[0].delta.content:
+            fragments.append(chunk.choices[0].delta.content)
+            return True
+        return False
+    
+    @staticmethod
+    def _openai_error(error: Exception) -> LLMAPIError:
+        """Wrap an openai SDK exception, keeping its status and Retry-After"""
+        # openai's status errors carry the HTTP response
+        response = getattr(error, 'response', None)
+        return LLMAPIError(
+            f"OpenAI API error: {error}",
+            getattr(error, 'status_code', None),
+            response.headers.get('Retry-After') if response is not None else None
         )
-        
-        if response.status_code == 200:
-            return response.json().get('response', '')
-        else:
-            raise Exception(f"Ollama API error: {response.status_code}")
     
-    def _generate_openai(self, prompt: str) -> Optional[str]:
-        """Generate using OpenAI API"""
-        import openai
+    @staticmethod
+    def _read_event(line: str, fragments: List[str]) -> bool:
+        """Append the content of one chat completion SSE line; True once the stream is done"""
+        if not line.startswith('data:'):
+            return False
         
-        config = self.config['llm_settings']['openai']
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return True
         
-        try:
-            client = openai.OpenAI(api_key=config['api_key'])
+        choices = _json_loads(data).get('choices')
+        if choices:
+            content = choices[0].get('delta', {}).get('content')
+            if content:
+                fragments.append(content)
+        return False
+    
+    def _generate_ollama(self, prompt: str, stop_at_code_block: bool = False) -> Optional[str]:
+        """Generate using Ollama"""
+        # Stream the reply and join the fragments rather than buffering one large body
+        with self._endpoint() as index, self._session.post(
+            f"{self._endpoints[index]}/api/generate", 
+            json=self._ollama_payload(prompt), 
+            timeout=self.config['llm_settings']['ollama'].get('timeout', 300),
+            stream=True
+        ) as response:
+            self._check_status(response, "Ollama")
             
-            response = client.chat.completions.create(
-                model=config['model'],
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=config.get('max_tokens', 4096),
-                temperature=config.get('temperature', 0.1)
-            )
+            fragments = []
+            for line in response.iter_lines():
+                if self._read_ollama_line(line, fragments) or (
+                        stop_at_code_block and fragments and _code_block_closed(fragments)):
+                    break
+            
+            return ''.join(fragments)
+    
+    def _generate_openai(self, prompt: str, stop_at_code_block: bool = False) -> Optional[str]:
+        """Generate using OpenAI API"""
+        try:
+            with self._endpoint() as index:
+                stream = self._openai_clients[index].chat.completions.create(**self._chat_payload(prompt))
+                
+                # Closing the stream early stops generation of the remaining tokens
+                fragments = []
+                try:
+                    for chunk in stream:
+                        if self._read_openai_chunk(chunk, fragments) and stop_at_code_block \
+                                and _code_block_closed(fragments):
+                            break
+                finally:
+                    stream.close()
             
-            return response.choices[0].message.content
+            return ''.join(fragments)
             
         except Exception as e:
-            raise Exception(f"OpenAI API error: {e}")
+            raise self._openai_error(e)
     
-    def _generate_github(self, prompt: str) -> Optional[str]:
+    def _generate_github(self, prompt: str, stop_at_code_block: bool = False) -> Optional[str]:
         """Generate using GitHub Models"""
-        config = self.config['llm_settings']['github']
+        url = f"{self.config['llm_settings']['github']['base_url']}/chat/completions"
         
-        url = f"{config['base_url']}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {config['api_key']}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": config['model'],
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": self.request_settings.get('max_tokens', 4096),
-            "temperature": self.request_settings.get('temperature', 0.1)
-        }
-        
-        response = requests.post(url, headers=headers, json=payload)
+        # Authorization is set once on the client; the reply arrives as server-sent events
+        with self._github_http.stream('POST', url, json=self._chat_payload(prompt)) as response:
+            self._check_status(response, "GitHub")
+            
+            fragments = []
+            for line in response.iter_lines():
+                if self._read_event(line, fragments) or (
+                        stop_at_code_block and fragments and _code_block_closed(fragments)):
+                    break
+            
+            return ''.join(fragments)
+    
+    async def aclose(self):
+        """Close the async clients opened by agenerate"""
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+        if self._async_github is not None:
+            await self._async_github.aclose()
+            self._async_github = None
+        if self._async_openai is not None:
+            for client in self._async_openai:
+                await client.close()
+            self._async_openai = None
+    
+    def _get_async_http(self):
+        """Return the shared async HTTP client, creating it on first use"""
+        if self._async_http is None:
+            import httpx
+            self._async_http = httpx.AsyncClient(http2=_http2_available())
+        return self._async_http
+    
+    def _get_async_github(self):
+        """Return the authenticated async GitHub Models client, creating it on first use"""
+        if self._async_github is None:
+            import httpx
+            self._async_github = httpx.AsyncClient(
+                **self._github_client_options(self.config['llm_settings']['github'])
+            )
+        return self._async_github
+    
+    def _get_async_openai(self):
+        """Return the async OpenAI clients, one per API key, creating them on first use"""
+        if self._async_openai is None:
+            import httpx
+            self._async_openai = [
+                self._openai.AsyncOpenAI(
+                    api_key=api_key,
+                    http_client=httpx.AsyncClient(limits=self._openai_limits)
+                )
+                for api_key in self._endpoints
+            ]
+        return self._async_openai
+    
+    async def _agenerate_ollama(self, prompt: str, stop_at_code_block: bool = False) -> Optional[str]:
+        """Generate using Ollama asynchronously"""
+        # Stream the reply and join the fragments rather than buffering one large body
+        with self._endpoint() as index:
+            async with self._get_async_http().stream(
+                'POST',
+                f"{self._endpoints[index]}/api/generate",
+                json=self._ollama_payload(prompt),
+                timeout=self.config['llm_settings']['ollama'].get('timeout', 300)
+            ) as response:
+                self._check_status(response, "Ollama")
+                
+                fragments = []
+                async for line in response.aiter_lines():
+                    if self._read_ollama_line(line, fragments) or (
+                            stop_at_code_block and fragments and _code_block_closed(fragments)):
+                        break
+                
+                return ''.join(fragments)
+    
+    async def _agenerate_openai(self, prompt: str, stop_at_code_block: bool = False) -> Optional[str]:
+        """Generate using OpenAI API asynchronously"""
+        try:
+            with self._endpoint() as index:
+                stream = await self._get_async_openai()[index].chat.completions.create(
+                    **self._chat_payload(prompt)
+                )
+                
+                # Closing the stream early stops generation of the remaining tokens
+                fragments = []
+                try:
+                    async for chunk in stream:
+                        if self._read_openai_chunk(chunk, fragments) and stop_at_code_block \
+                                and _code_block_closed(fragments):
+                            break
+                finally:
+                    await stream.close()
+            
+            return ''.join(fragments)
+            
+        except Exception as e:
+            raise self._openai_error(e)
+    
+    async def _agenerate_github(self, prompt: str, stop_at_code_block: bool = False) -> Optional[str]:
+        """Generate using GitHub Models asynchronously"""
+        url = f"{self.config['llm_settings']['github']['base_url']}/chat/completions"
         
-        if response.status_code == 200:
-            return response.json()['choices'][0]['message']['content']
-        else:
-            raise Exception(f"GitHub API error: {response.status_code}")
+        # Like the sync client, authorization and the timeout are set once on the client
+        async with self._get_async_github().stream('POST', url, json=self._chat_payload(prompt)) as response:
+            self._check_status(response, "GitHub")
+            
+            fragments = []
+            async for line in response.aiter_lines():
+                if self._read_event(line, fragments) or (
+                        stop_at_code_block and fragments and _code_block_closed(fragments)):
+                    break
+            
+            return ''.join(fragments)
     
     def test_connection(self) -> bool:
         """Test if the LLM connection is working"""
+        # Reuse a recent result rather than sending another request
+        now = time.monotonic()
+        if self._connection_status is not None and now - self._connection_status[0] < _CONNECTION_TTL:
+            return self._connection_status[1]
+        
         try:
             test_prompt = "Hello, respond with 'OK' if you can see this message."
-            response = self.generate(test_prompt)
-            return response is not None and len(response.strip()) > 0
+            # Bypass the cache so this actually reaches the provider
+            response = self.generate(test_prompt, use_cache=False)
+            connected = response is not None and len(response.strip()) > 0
         except:
-            return False 
\ No newline at end of file
+            connected = False
+        
+        self._connection_status = (now, connected)
+        return connected 
\ No newline at end of file
@@ -4,12 +4,27 @@ Setup script for the C++ Unit Test Generator
 Helps users configure the environment and check dependencies
 """
 
+import argparse
 import os
+import shutil
 import sys
 import subprocess
 import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
 
+# Add the project root to the path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from scripts.build_instructions import build_bundle
+from scripts.console import ThreadedStdout
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
 def check_python_version():
     """Check if Python version is compatible"""
     if sys.version_info < (3, 8):
@@ -18,21 +33,25 @@ def check_python_version():
     print(f"✅ Python {sys.version_info.major}.{sys.version_info.minor}")
     return True
 
-def check_cmake():
+def _version_line(path: str) -> str:
+    """First line of a tool's --version output, for diagnostics"""
+    result = subprocess.run([path, '--version'], capture_output=True)
+    return result.stdout.decode(errors='replace').split('\n')[0]
+
+def check_cmake(debug: bool = False):
     """Check if CMake is installed"""
-    try:
-        result = subprocess.run(['cmake', '--version'], capture_output=True)
-        if result.returncode == 0:
-            version_line = result.stdout.decode().split('\n')[0]
-            print(f"✅ {version_line}")
-            return True
-    except FileNotFoundError:
-        pass
+    # A PATH lookup is enough to know it is there; only run it when asked for the version
+    path = shutil.which('cmake')
+    if path:
+        print(f"✅ CMake at {path}")
+        if debug:
+            print(f"   {_version_line(path)}")
+        return True
     
     print("❌ CMake not found. Please install CMake 3.16 or higher")
     return False
 
-def check_compiler():
+def check_compiler(debug: bool = False):
     """Check if a C++ compiler is available"""
     compilers = [
         ('g++', 'GCC'),
@@ -41,29 +60,19 @@ def check_compiler():
     ]
     
     for compiler, name in compilers:
-        try:
-            result = subprocess.run([compiler, '--version'], capture_output=True)
-            if result.returncode == 0:
-                print(f"✅ {name} compiler found")
-                return True
-        except FileNotFoundError:
-            continue
+        path = shutil.which(compiler)
+        if path:
+            print(f"✅ {name} compiler found at {path}")
+            if debug:
+                print(f"   {_version_line(path)}")
+            return True
     
     print("❌ No C++ compiler found. Please install GCC, Clang, or MSVC")
     return False
 
 def check_gtest():
     """Check if Google Test is available"""
-    # Try pkg-config first
-    try:
-        result = subprocess.run(['pkg-config', '--exists', 'gtest'], capture_output=True)
-        if result.returncode == 0:
-            print("✅ Google Test found via pkg-config")
-            return True
-    except FileNotFoundError:
-        pass
-    
-    # Check common installation paths
+    # Check common installation paths before paying for a subprocess
     common_paths = [
         '/usr/include/gtest',
         '/usr/local/include/gtest',
@@ -76,6 +85,16 @@ def check_gtest():
             print(f"✅ Google Test found at {path}")
             return True
     
+    # Fall back to pkg-config when it is installed
+    if shutil.which('pkg-config'):
+        try:
+            result = subprocess.run(['pkg-config', '--exists', 'gtest'], capture_output=True)
+            if result.returncode == 0:
+                print("✅ Google Test found via pkg-config")
+                return True
+        except OSError as e:
+            print(f"⚠️  Could not run pkg-config: {e}")
+    
     print("❌ Google Test not found. Please install Google Test")
     print("   Ubuntu/Debian: sudo apt-get install libgtest-dev")
     print("   macOS: brew install googletest")
@@ -86,7 +105,8 @@ def check_ollama():
     """Check if Ollama is running"""
     try:
         import requests
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        # Only liveness matters here, so a HEAD on the root is enough
+        response = requests.head("http://localhost:11434/", timeout=2)
         if response.status_code == 200:
             print("✅ Ollama is running")
             return True
@@ -167,32 +187,63 @@ def create_sample_config():
     
     try:
         with open(config_path, 'w') as f:
-            yaml.dump(sample_config, f, default_flow_style=False, indent=2)
+            yaml.dump(sample_config, f, Dumper=SafeDumper, default_flow_style=False, indent=2)
         print("✅ Sample configuration created at config/llm_config.yaml")
         return True
     except Exception as e:
         print(f"❌ Failed to create configuration: {e}")
         return False
 
-def main():
+def run_checks(checks) -> bool:
+    """Run the dependency checks concurrently, reporting each as it finishes"""
+    all_passed = True
+    stdout = ThreadedStdout(sys.stdout)
+    sys.stdout = stdout
+    
+    try:
+        with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+            futures = {executor.submit(stdout.capture, check_func): name for name, check_func in checks}
+            
+            for future in as_completed(futures):
+                # A check that raises counts as failed rather than stopping the others
+                try:
+                    passed, output = future.result()
+                except Exception as e:
+                    passed, output = False, f"❌ Check failed: {e}\n"
+                print(f"\n🔍 Checking {futures[future]}...")
+                print(output, end='')
+                if not passed:
+                    all_passed = False
+    finally:
+        sys.stdout = stdout.stream
+        
+    return all_passed
+
+def bundle_instructions():
+    """Prebuild the instruction bundle the generator loads at startup"""
+    try:
+        bundle_path = build_bundle("yaml_instructions")
+        print(f"✅ Instructions bundled into {bundle_path}")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to bundle instructions: {e}")
+        return False
+
+def main(debug: bool = False):
     """Main setup function"""
     print("🚀 C++ Unit Test Generator Setup")
     print("=" * 40)
     
     checks = [
         ("Python Version", check_python_version),
-        ("CMake", check_cmake),
-        ("C++ Compiler", check_compiler),
+        ("CMake", partial(check_cmake, debug)),
+        ("C++ Compiler", partial(check_compiler, debug)),
         ("Google Test", check_gtest),
         ("Ollama", check_ollama)
     ]
     
-    all_passed = True
-    
-    for name, check_func in checks:
-        print(f"\n🔍 Checking {name}...")
-        if not check_func():
-            all_passed = False
+    # Each check mostly waits on a subprocess or the network, so run them together
+    all_passed = run_checks(checks)
     
     print(f"\n📦 Setting up Python environment...")
     if not install_python_dependencies():
@@ -202,6 +253,10 @@ def main():
     if not create_sample_config():
         all_passed = False
     
+    print(f"\n📚 Bundling instructions...")
+    if not bundle_instructions():
+        all_passed = False
+    
     print("\n" + "=" * 40)
     
     if all_passed:
@@ -216,5 +271,10 @@ def main():
     return all_passed
 
 if __name__ == "__main__":
-    success = main()
+    parser = argparse.ArgumentParser(description='Set up the C++ Unit Test Generator')
+    parser.add_argument('--debug', action='store_true',
+                       help='Print tool versions while checking dependencies')
+    args = parser.parse_args()
+    
+    success = main(args.debug)
     sys.exit(0 if success else 1) 
\ No newline at end of file
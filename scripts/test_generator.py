@@ -5,14 +5,19 @@ Main script for generating, refining, and optimizing unit tests
 """
 
 import argparse
+import asyncio
+import functools
+import hashlib
 import os
 import sys
 import yaml
 import json
 import time
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 # Add the project root to the path
 sys.path.append(str(Path(__file__).parent.parent))
@@ -21,6 +26,59 @@ from scripts.llm_client import LLMClient
 from scripts.cpp_analyzer import CppAnalyzer
 from scripts.build_manager import BuildManager
 from scripts.coverage_analyzer import CoverageAnalyzer
+from scripts.build_instructions import BUNDLE_NAME
+
+# libyaml's C loader is far faster than the pure-Python one when it is available
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+# RE2 matches in linear time when google-re2 is installed; the stdlib engine is the fallback
+try:
+    import re2 as _block_re
+except ImportError:
+    _block_re = re
+
+# Fenced C++ code block in an LLM response
+_CPP_BLOCK_RE = _block_re.compile(r'(?s)```(?:cpp|c\+\+)?\s*(.*?)\s*```')
+
+# Records the prompt hash each generated test was made from
+_MANIFEST_NAME = ".testgen_manifest.json"
+
+# A source file read for generation, with its prompt and the hash recorded in the manifest
+_PreparedSource = namedtuple('_PreparedSource', 'code_content prompt digest')
+
+# A line that opens or closes a fenced code block
+_FENCE_LINE_RE = re.compile(r'^\s*```')
+
+# Marker line that opens each file's tests in a batched response
+_FILE_SENTINEL_RE = re.compile(r'^\s*// FILE: (.+?)\s*$', re.MULTILINE)
+
+# Loaded instructions per directory, with the file mtimes they were loaded at
+_instructions_cache = {}
+
+# The helpers are stateless or cache internally, so every TestGenerator in the
+# process shares one of each (lru_cache rather than functools.cache for Python 3.8)
+@functools.lru_cache(maxsize=None)
+def _get_analyzer() -> CppAnalyzer:
+    """Shared C++ analyzer"""
+    return CppAnalyzer()
+
+@functools.lru_cache(maxsize=None)
+def _get_build_manager() -> BuildManager:
+    """Shared build manager"""
+    return BuildManager()
+
+@functools.lru_cache(maxsize=None)
+def _get_coverage() -> CoverageAnalyzer:
+    """Shared coverage analyzer"""
+    return CoverageAnalyzer()
 
 class TestGenerator:
     """Main test generator class"""
@@ -28,16 +86,16 @@ class TestGenerator:
     def __init__(self, config_path: str = "config/llm_config.yaml"):
         self.config = self._load_config(config_path)
         self.llm_client = LLMClient(self.config)
-        self.cpp_analyzer = CppAnalyzer()
-        self.build_manager = BuildManager()
-        self.coverage_analyzer = CoverageAnalyzer()
+        self.cpp_analyzer = _get_analyzer()
+        self.build_manager = _get_build_manager()
+        self.coverage_analyzer = _get_coverage()
         self.instructions = self._load_instructions()
         
     def _load_config(self, config_path: str) -> Dict:
         """Load configuration from YAML file"""
         try:
             with open(config_path, 'r') as f:
-                return yaml.safe_load(f)
+                return yaml.load(f, Loader=SafeLoader)
         except FileNotFoundError:
             print(f"Config file not found: {config_path}")
             return self._get_default_config()
@@ -56,19 +114,65 @@ class TestGenerator:
         }
     
     def _load_instructions(self) -> Dict:
-        """Load YAML instruction files"""
+        """Load YAML instruction files, reusing those this process already loaded"""
         instructions = {}
         instruction_dir = Path("yaml_instructions")
         
         if instruction_dir.exists():
-            for yaml_file in instruction_dir.glob("*.yaml"):
-                with open(yaml_file, 'r') as f:
-                    instructions[yaml_file.stem] = yaml.safe_load(f)
+            yaml_files = sorted(instruction_dir.glob("*.yaml"))
+            mtimes = tuple((yaml_file.name, yaml_file.stat().st_mtime_ns) for yaml_file in yaml_files)
+            
+            # Keyed on the files' mtimes so edits are still picked up
+            key = str(instruction_dir.resolve())
+            cached = _instructions_cache.get(key)
+            if cached is not None and cached[0] == mtimes:
+                return cached[1]
+            
+            # The prebuilt bundle holds every file; use it unless a YAML file is newer
+            bundle = instruction_dir / BUNDLE_NAME
+            try:
+                bundle_mtime = bundle.stat().st_mtime_ns
+                if all(mtime <= bundle_mtime for _, mtime in mtimes):
+                    instructions = _json_loads(bundle.read_bytes())
+            except (OSError, ValueError):
+                pass
+            
+            if not instructions:
+                for yaml_file in yaml_files:
+                    instructions[yaml_file.stem] = self._load_instruction_file(yaml_file)
+                    
+            _instructions_cache[key] = (mtimes, instructions)
                 
         return instructions
     
-    def generate_tests(self, input_dir: str, output_dir: str) -> bool:
-        """Main test generation workflow"""
+    def _load_instruction_file(self, yaml_file: Path) -> Dict:
+        """Load one instruction file, using its JSON cache when it is up to date"""
+        json_file = yaml_file.with_name(yaml_file.name + '.json')
+        
+        try:
+            if json_file.stat().st_mtime_ns >= yaml_file.stat().st_mtime_ns:
+                return _json_loads(json_file.read_bytes())
+        except (OSError, ValueError):
+            pass
+        
+        with open(yaml_file, 'r') as f:
+            data = yaml.load(f, Loader=SafeLoader)
+        
+        # The cache is only an optimisation, so failing to write it is not an error
+        try:
+            with open(json_file, 'w') as f:
+                json.dump(data, f)
+        except (OSError, TypeError):
+            pass
+            
+        return data
+    
+    def generate_tests(self, input_dir: str, output_dir: str, timeout: Optional[float] = None) -> bool:
+        """Main test generation workflow
+        
+        Raises TimeoutError if the LLM requests take longer than timeout seconds;
+        requests still in flight are cancelled first.
+        """
         print("🚀 Starting C++ Unit Test Generation")
         
         # Step 1: Analyze C++ source files
@@ -81,55 +185,283 @@ class TestGenerator:
             
         print(f"Found {len(cpp_files)} C++ files")
         
-        # Step 2: Generate initial tests
+        # Step 2: Generate initial tests, saving each one as soon as it arrives
         print("\n🧪 Generating initial unit tests...")
-        generated_tests = {}
+        print(f"💾 Saving tests to {output_dir}")
+        os.makedirs(output_dir, exist_ok=True)
         
-        for cpp_file in cpp_files:
-            print(f"  Processing: {cpp_file}")
-            test_code = self._generate_initial_test(cpp_file)
-            
+        manifest_path = os.path.join(output_dir, _MANIFEST_NAME)
+        manifest = self._load_manifest(manifest_path)
+        
+        # LLM calls are independent network round-trips, so issue them concurrently;
+        # source reads, prompt building and test writes run on a thread pool so
+        # disk I/O overlaps them
+        with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as pool:
+            try:
+                results, skipped = asyncio.run(asyncio.wait_for(
+                    self._agenerate_tests(cpp_files, manifest, output_dir, pool), timeout
+                ))
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Test generation timed out after {timeout} seconds") from None
+        
+        if skipped:
+            print(f"⏭️  Skipping {len(skipped)} unchanged files")
+        
+        generated_tests = {}
+        for cpp_file, (digest, test_code) in results.items():
             if test_code:
-                test_filename = f"test_{Path(cpp_file).stem}.cpp"
-                generated_tests[test_filename] = {
+                generated_tests[self._test_filename(cpp_file)] = {
                     'code': test_code,
                     'source_file': cpp_file
                 }
+                manifest[cpp_file] = digest
                 
-        if not generated_tests:
+        # Unreadable sources were reported already; fail only if the LLM produced
+        # nothing it was asked for, or there are no tests at all
+        if not generated_tests and (results or not skipped):
             print("❌ Failed to generate any tests")
             return False
-            
-        # Step 3: Save tests to output directory
-        print(f"\n💾 Saving tests to {output_dir}")
-        os.makedirs(output_dir, exist_ok=True)
         
-        for test_filename, test_data in generated_tests.items():
-            test_path = os.path.join(output_dir, test_filename)
-            with open(test_path, 'w') as f:
-                f.write(test_data['code'])
+        if generated_tests:
+            self._save_manifest(manifest_path, manifest)
         
-        # Step 4: Create CMakeLists.txt
+        # Step 3: Create CMakeLists.txt
         self._create_cmake_file(input_dir, output_dir)
         
         print("\n✅ Test generation completed!")
         return True
     
-    def _generate_initial_test(self, cpp_file: str) -> Optional[str]:
+    async def _agenerate_tests(self, cpp_files: List[str], manifest: Dict[str, str], output_dir: str,
+                               pool: ThreadPoolExecutor) -> Tuple[Dict[str, Tuple[str, Optional[str]]], List[str]]:
+        """Generate and save initial tests for all files, bounded by max_concurrency
+        
+        Returns the (prompt hash, test code) of every file sent to the LLM, and
+        the files skipped because their prompt is unchanged since the manifest.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.config['llm_settings'].get('max_concurrency', 8))
+        results = {}
+        skipped = []
+        
+        async def _pipeline(batch: List[str]):
+            # Each batch reads and hashes its own sources, so reads overlap other batches' LLM calls
+            prepared = {}
+            for cpp_file, source in zip(batch, await asyncio.gather(
+                    *(loop.run_in_executor(pool, self._prepare_source, cpp_file) for cpp_file in batch))):
+                if source is None:
+                    continue
+                # A file whose prompt and headers are unchanged since its test was
+                # generated needs no LLM call
+                if manifest.get(cpp_file) == source.digest and \
+                        os.path.exists(os.path.join(output_dir, self._test_filename(cpp_file))):
+                    skipped.append(cpp_file)
+                else:
+                    prepared[cpp_file] = source
+            if not prepared:
+                return
+            
+            async with semaphore:
+                print(f"  Processing: {', '.join(prepared)}")
+                if len(prepared) == 1:
+                    cpp_file, source = next(iter(prepared.items()))
+                    test_codes = {cpp_file: await self._agenerate_initial_test(cpp_file, source.prompt)}
+                else:
+                    test_codes = await self._agenerate_batch_tests(prepared)
+            
+            for cpp_file, test_code in test_codes.items():
+                results[cpp_file] = (prepared[cpp_file].digest, test_code)
+                if test_code:
+                    test_path = os.path.join(output_dir, self._test_filename(cpp_file))
+                    await loop.run_in_executor(pool, self._write_test, test_path, test_code)
+        
+        try:
+            await asyncio.gather(*(_pipeline(batch) for batch in self._batch_files(cpp_files)))
+            return results, skipped
+        finally:
+            await self.llm_client.aclose()
+    
+    def _prepare_source(self, cpp_file: str) -> Optional[_PreparedSource]:
+        """Read a source file and build its prompt and prompt hash, or None if that fails"""
+        try:
+            code_content = self._read_source(cpp_file)
+            prompt = self._build_prompt(code_content, cpp_file)
+            return _PreparedSource(code_content, prompt, self._prompt_hash(cpp_file, code_content, prompt))
+        except Exception as e:
+            print(f"Error generating test for {cpp_file}: {e}")
+            return None
+    
+    def _batch_files(self, cpp_files: List[str]) -> List[List[str]]:
+        """Group small source files so several share one LLM request"""
+        settings = self.config.get('generation_settings', {})
+        max_chars = settings.get('max_prompt_chars', 6000)
+        max_files = settings.get('max_batch_files', 4)
+        
+        # An instruction file without a batch template only knows how to prompt
+        # for one file, so its prompt_template is used for every file
+        if not self._batch_template_available():
+            max_files = 1
+        
+        batches = []
+        batch, batch_chars = [], 0
+        for cpp_file in cpp_files:
+            size = os.path.getsize(cpp_file)
+            
+            # Sentinels are bare file names, so a batch never holds two of the same name
+            if batch and (batch_chars + size > max_chars or len(batch) >= max_files
+                          or Path(cpp_file).name in {Path(f).name for f in batch}):
+                batches.append(batch)
+                batch, batch_chars = [], 0
+            
+            batch.append(cpp_file)
+            batch_chars += size
+            
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    async def _agenerate_initial_test(self, cpp_file: str, prompt: str) -> Optional[str]:
         """Generate initial unit test for a C++ file"""
         try:
-            # Read the C++ source code
-            with open(cpp_file, 'r') as f:
-                code_content = f.read()
+            # Generate test using LLM
+            response = await self.llm_client.agenerate(prompt, stop_at_code_block=True)
+            
+            if response:
+                return self._extract_cpp_code(response)
                 
-            # Create a simple prompt if no instruction file exists
-            if 'initial_generation' in self.instructions:
-                instruction = self.instructions['initial_generation']
-                prompt_template = instruction.get('prompt_template', '')
-                filename = Path(cpp_file).stem
-                prompt = prompt_template.format(code_content=code_content, original_filename=filename)
-            else:
-                prompt = f"""Generate comprehensive unit tests for the following C++ code using Google Test framework:
+        except Exception as e:
+            print(f"Error generating test for {cpp_file}: {e}")
+            
+        return None
+    
+    async def _agenerate_batch_tests(self, prepared: Dict[str, _PreparedSource]) -> Dict[str, Optional[str]]:
+        """Generate tests for several small files with one LLM request"""
+        batch = list(prepared)
+        test_codes = {}
+        try:
+            code_contents = [prepared[cpp_file].code_content for cpp_file in batch]
+            response = await self.llm_client.agenerate(self._build_batch_prompt(batch, code_contents))
+            
+            if response:
+                test_codes = self._split_batch_response(response, batch)
+                
+        except Exception as e:
+            print(f"Error generating tests for {', '.join(batch)}: {e}")
+        
+        # Files the response did not cover go through the per-file path
+        missing = [cpp_file for cpp_file in batch if not test_codes.get(cpp_file)]
+        if missing:
+            print(f"  Batched response incomplete, retrying per file: {', '.join(missing)}")
+            retried = await asyncio.gather(
+                *(self._agenerate_initial_test(cpp_file, prepared[cpp_file].prompt) for cpp_file in missing)
+            )
+            test_codes.update(zip(missing, retried))
+            
+        return test_codes
+    
+    def _split_batch_response(self, response: str, batch: List[str]) -> Dict[str, str]:
+        """Split a batched response into per-file test code using the FILE sentinels"""
+        by_name = {Path(cpp_file).name: cpp_file for cpp_file in batch}
+        parts = _FILE_SENTINEL_RE.split(response)
+        
+        # split() alternates: preamble, name, body, name, body, ...
+        test_codes = {}
+        for name, body in zip(parts[1::2], parts[2::2]):
+            cpp_file = by_name.get(Path(name.strip('`*')).name)
+            if cpp_file is not None:
+                test_code = self._batch_part_code(body)
+                if test_code:
+                    test_codes[cpp_file] = test_code
+                    
+        return test_codes
+    
+    def _batch_part_code(self, body: str) -> Optional[str]:
+        """Test code in one file's part of a batched response, or None if it is malformed
+        
+        The sentinel may come before the file's fence or as the first line inside
+        it. In the first case the part opens with a complete fenced block; in the
+        second it starts with the code, which runs up to the closing fence.
+        Whatever follows (prose, or the next file's opening fence) is ignored.
+        """
+        lines = body.strip().splitlines()
+        fences = [i for i, line in enumerate(lines) if _FENCE_LINE_RE.match(line)]
+        
+        if fences and fences[0] == 0:
+            # A block that never closes was cut off
+            if len(fences) < 2:
+                return None
+            code_lines = lines[1:fences[1]]
+        else:
+            code_lines = lines[:fences[0]] if fences else lines
+        
+        test_code = '\n'.join(code_lines).strip()
+        if not test_code or test_code.startswith('```') or test_code.endswith('```'):
+            return None
+        return test_code
+    
+    def _test_filename(self, cpp_file: str) -> str:
+        """Name of the generated test file for a source file"""
+        return f"test_{Path(cpp_file).stem}.cpp"
+    
+    def _prompt_hash(self, cpp_file: str, code_content: str, prompt: str) -> str:
+        """SHA-256 of everything a source file's generated test depends on
+        
+        That is its prompt, which holds the source or its public API and the
+        instruction template, plus the project headers it includes and the
+        template used when it is batched.
+        """
+        digest = hashlib.sha256(prompt.encode())
+        
+        for header_path in self.cpp_analyzer.local_headers(cpp_file, code_content):
+            with open(header_path, 'rb') as f:
+                digest.update(f.read())
+        
+        batch_template = self.instructions.get('initial_generation', {}).get('batch_prompt_template', '')
+        digest.update(batch_template.encode())
+        return digest.hexdigest()
+    
+    def _load_manifest(self, manifest_path: str) -> Dict[str, str]:
+        """Load the prompt hash manifest, or an empty one if it is missing or unreadable"""
+        try:
+            with open(manifest_path, 'rb') as f:
+                return _json_loads(f.read())
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_manifest(self, manifest_path: str, manifest: Dict[str, str]):
+        """Write the manifest atomically so an interrupted run can't leave it truncated"""
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+    
+    def _read_source(self, cpp_file: str) -> str:
+        """Read a C++ source file, reducing a large one to its public API"""
+        # Prompt size drives prefill time, so big files are sent as declarations only
+        threshold = self.config.get('generation_settings', {}).get('full_source_threshold', 2048)
+        size = os.path.getsize(cpp_file)
+        if size > threshold:
+            # Inlined headers can outweigh the dropped bodies, so keep whichever is shorter
+            public_api = self.cpp_analyzer.extract_public_api(cpp_file)
+            if len(public_api) < size:
+                return public_api
+        
+        with open(cpp_file, 'r') as f:
+            return f.read()
+    
+    def _write_test(self, test_path: str, test_code: str):
+        """Write a generated test file"""
+        Path(test_path).write_text(test_code)
+    
+    def _build_prompt(self, code_content: str, cpp_file: str) -> str:
+        """Build the test generation prompt for a source file"""
+        # Create a simple prompt if no instruction file exists
+        if 'initial_generation' in self.instructions:
+            instruction = self.instructions['initial_generation']
+            prompt_template = instruction.get('prompt_template', '')
+            filename = Path(cpp_file).stem
+            return prompt_template.format(code_content=code_content, original_filename=filename)
+        
+        return f"""Generate comprehensive unit tests for the following C++ code using Google Test framework:
 
 ```cpp
 {code_content}
@@ -143,26 +475,48 @@ Requirements:
 - Use descriptive test names
 
 Generate only the test code without explanations."""
-            
-            # Generate test using LLM
-            response = self.llm_client.generate(prompt)
-            
-            if response:
-                return self._extract_cpp_code(response)
-                
-        except Exception as e:
-            print(f"Error generating test for {cpp_file}: {e}")
-            
-        return None
+    
+    def _batch_template_available(self) -> bool:
+        """Whether batched prompts can be built from the loaded instructions"""
+        instruction = self.instructions.get('initial_generation')
+        return instruction is None or bool(instruction.get('batch_prompt_template'))
+    
+    def _build_batch_prompt(self, batch: List[str], code_contents: List[str]) -> str:
+        """Build one test generation prompt covering several source files"""
+        files = "\n\n".join(
+            f"// FILE: {Path(cpp_file).name}\n```cpp\n{code_content}\n```"
+            for cpp_file, code_content in zip(batch, code_contents)
+        )
+        
+        # Create a simple prompt if no instruction file exists
+        if 'initial_generation' in self.instructions:
+            return self.instructions['initial_generation']['batch_prompt_template'].format(files=files)
+        
+        return f"""Generate comprehensive unit tests for each of the following C++ files using Google Test framework:
+
+{files}
+
+Requirements:
+- Use Google Test (gtest) framework
+- Include all necessary headers
+- Test all public methods and functions
+- Cover edge cases and error conditions
+- Use descriptive test names
+
+Output format:
+- Write a separate test file for every source file above
+- Start each one with a line containing only `// FILE: <name>`, using the source file name exactly as given
+- Follow that line with the test code in a single ```cpp code block
+
+Generate only the test code without explanations."""
     
     def _extract_cpp_code(self, response: str) -> str:
         """Extract C++ code from LLM response"""
-        # Look for code blocks
-        cpp_pattern = r'```(?:cpp|c\+\+)?\s*(.*?)\s*```'
-        matches = re.findall(cpp_pattern, response, re.DOTALL)
+        # Look for the first code block
+        match = _CPP_BLOCK_RE.search(response)
         
-        if matches:
-            return matches[0].strip()
+        if match:
+            return match.group(1).strip()
         
         # If no code blocks found, return the response as-is
         return response.strip()
@@ -205,9 +559,24 @@ enable_testing()
 add_test(NAME unit_tests COMMAND run_tests)
 """
         
-        cmake_path = os.path.join(output_dir, "CMakeLists.txt")
-        with open(cmake_path, 'w') as f:
-            f.write(cmake_content)
+        Path(output_dir, "CMakeLists.txt").write_text(cmake_content)
+
+def run(input_dir: str, output_dir: str, config_path: str = "config/llm_config.yaml",
+        timeout: Optional[float] = None) -> int:
+    """Generate tests for input_dir into output_dir, returning a process exit code
+    
+    Raises TimeoutError if generation takes longer than timeout seconds.
+    """
+    # Validate input directory
+    if not os.path.isdir(input_dir):
+        print(f"❌ Input directory does not exist: {input_dir}")
+        return 1
+    
+    # Create generator and run
+    generator = TestGenerator(config_path)
+    success = generator.generate_tests(input_dir, output_dir, timeout)
+    
+    return 0 if success else 1
 
 def main():
     parser = argparse.ArgumentParser(description='C++ Unit Test Generator')
@@ -220,16 +589,7 @@ def main():
     
     args = parser.parse_args()
     
-    # Validate input directory
-    if not os.path.isdir(args.input):
-        print(f"❌ Input directory does not exist: {args.input}")
-        sys.exit(1)
-    
-    # Create generator and run
-    generator = TestGenerator(args.config)
-    success = generator.generate_tests(args.input, args.output)
-    
-    sys.exit(0 if success else 1)
+    sys.exit(run(args.input, args.output, args.config))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file